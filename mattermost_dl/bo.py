@@ -26,7 +26,6 @@ from . import jsonvalidation
 
 from collections.abc import Iterable
 from datetime import datetime
-from functools import total_ordering
 import json
 import jsonschema
 
@@ -54,37 +53,49 @@ class EntityLocator:
     def __repr__(self) -> str:
         return f'EntityLocator({self.__dict__})'
 
-@total_ordering
-class Time:
-    def __init__(self, time: Union[int, str]):
-        self._time: int
-        # time is unix timestamp in miliseconds
+    def key(self) -> Tuple[str, str]:
+        '''
+            Returns hashable pair of identificator kind and value,
+            suitable for lookups in indexes of entities by their identificators.
+        '''
+        if hasattr(self, 'id'):
+            return ('id', self.id)
+        elif hasattr(self, 'internalName'):
+            return ('internalName', self.internalName)
+        else:
+            return ('name', self.name)
+
+class Time(int):
+    '''
+        Unix timestamp in miliseconds. Being an int, it gets created, compared
+        and serialized at the cost of plain number.
+    '''
+    __slots__ = ()
+
+    def __new__(cls, time: Union[int, str]) -> 'Time':
         if isinstance(time, int):
-            self._time = time
+            return super().__new__(cls, time)
         else:
             assert isinstance(time, str)
-            self._time = int(datetime.fromisoformat(time).timestamp() * 1000)
+            return super().__new__(cls, int(datetime.fromisoformat(time).timestamp() * 1000))
 
     # Returns unix timestamp in miliseconds
     @property
     def timestamp(self) -> int:
-        return self._time
-    def __eq__(self, other: 'Time'):
-        return self._time == other._time
-    def __lt__(self, other: 'Time'):
-        return self._time < other._time
-    # Needed to silence linter
-    def __gt__(self, other: 'Time'):
-        return self._time > other._time
+        return int(self)
+
+    # Times are present or missing, the epoch itself shouldn't be treated as missing
+    def __bool__(self) -> bool:
+        return True
 
     def __str__(self):
-        fmt = datetime.fromtimestamp(self._time/1000).isoformat()
+        fmt = datetime.fromtimestamp(self/1000).isoformat()
         fractionStart = fmt.rfind('.')
         if fractionStart != -1:
             fmt = fmt[:fractionStart]
         return fmt
     def __repr__(self):
-        return f"'{datetime.fromtimestamp(self._time/1000).isoformat()}'"
+        return f"'{datetime.fromtimestamp(self/1000).isoformat()}'"
 
     def toStore(self) -> int:
         return self.timestamp
@@ -278,15 +289,6 @@ class User(JsonMessage):
             return jsonMemberValue
         return NotImplemented
 
-    def match(self, locator: EntityLocator) -> bool:
-        if hasattr(locator, 'id'):
-            return self.id == locator.id
-        elif hasattr(locator, 'name'):
-            return self.name == locator.name
-        else:
-            assert hasattr(locator, 'internalName')
-            return self.name == locator.internalName
-
 
 @dataclass
 class Emoji(JsonMessage):
@@ -691,15 +693,6 @@ class Channel(JsonMessage):
             return [User.fromStore(u) for u in jsonMemberValue]
         return NotImplemented
 
-    def match(self, locator: EntityLocator) -> bool:
-        if hasattr(locator, 'id'):
-            return self.id == locator.id
-        elif hasattr(locator, 'internalName'):
-            return self.internalName == locator.internalName
-        else:
-            assert hasattr(locator, 'name')
-            return self.name == locator.name
-
 
 class TeamType(Enum):
     Open = 'O'
@@ -786,12 +779,3 @@ class Team(JsonMessage):
 
     def __str__(self):
         return f'Team({self.internalName})'
-
-    def match(self, locator: EntityLocator) -> bool:
-        if hasattr(locator, 'id'):
-            return self.id == locator.id
-        elif hasattr(locator, 'internalName'):
-            return self.internalName == locator.internalName
-        else:
-            assert hasattr(locator, 'name')
-            return self.name == locator.name
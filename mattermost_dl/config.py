@@ -189,6 +189,10 @@ class ConfigFile:
     token: str = ''
 
     throttlingLoopDelay: int = 0
+    # Number of channels downloaded concurrently, 0 selects automatic amount
+    parallelism: int = 1
+    # Number of files downloaded concurrently within single channel, 0 selects automatic amount
+    fileParallelism: int = 1
     miscTeams: bool = True
     explicitTeams: List[TeamSpec] = dataclassfield(default_factory=list)
     miscDirectChannels: bool = True
@@ -286,7 +290,13 @@ class ConfigFile:
                 self.token = connection['token']
 
         if 'throttling' in config:
-            self.throttlingLoopDelay = config['throttling']['loopDelay']
+            throttling = config['throttling']
+            if 'loopDelay' in throttling:
+                self.throttlingLoopDelay = throttling['loopDelay']
+            if 'parallelism' in throttling:
+                self.parallelism = throttling['parallelism']
+            if 'fileParallelism' in throttling:
+                self.fileParallelism = throttling['fileParallelism']
         if 'output' in config:
             output = config['output']
             if 'directory' in output:
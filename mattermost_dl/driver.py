@@ -7,8 +7,11 @@ from .common import *
 from .bo import *
 from .config import ConfigFile, OrderDirection
 
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import contextmanager
 import json
 import requests
+from threading import Lock, local
 from time import sleep
 
 @dataclass
@@ -16,6 +19,19 @@ class Cache:
     users: Dict[Id, User] = dataclassfield(default_factory=dict)
     teams: Dict[Id, Team] = dataclassfield(default_factory=dict)
     emojis: Dict[Id, Emoji] = dataclassfield(default_factory=dict)
+    # Secondary indexes for lookups by name
+    usersByName: Dict[str, User] = dataclassfield(default_factory=dict)
+    emojisByName: Dict[str, Emoji] = dataclassfield(default_factory=dict)
+    # Set only after the emoji maps are completely filled, so readers never see them partial
+    emojisLoaded: bool = False
+
+    def addUser(self, user: User):
+        self.users[user.id] = user
+        self.usersByName[user.name] = user
+
+    def addEmoji(self, emoji: Emoji):
+        self.emojis[emoji.id] = emoji
+        self.emojisByName[emoji.name] = emoji
 
 class MattermostDriver:
     API_PART = '/api/v4/'
@@ -26,7 +42,35 @@ class MattermostDriver:
         # Information we get along the way
         self.context: Dict[str, Any] = {}
         self.cache = Cache()
-        self.session = requests.Session()
+        # Guards lazy loading of bulk cached data when driver is shared between threads
+        self.cacheLock = Lock()
+        # Sessions aren't safe to share between threads, each one gets its own
+        self.threadLocal = local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self.threadLocal, 'session', None)
+        if session is None:
+            session = self.threadLocal.session = requests.Session()
+        return session
+
+    @contextmanager
+    def workerPool(self, maxWorkers: int, wait: bool = True) -> Generator[ThreadPoolExecutor, None, None]:
+        '''
+            Thread pool for tasks using the driver, closing sessions of its workers once it's shut down.
+            Requests of workers not waited for still finish, their connections just don't get reused.
+        '''
+        workerSessions: List[requests.Session] = []
+        def registerWorker():
+            # Runs in the worker thread, so it gets that thread's own session
+            workerSessions.append(self.session)
+        executor = ThreadPoolExecutor(max_workers=maxWorkers, initializer=registerWorker)
+        try:
+            yield executor
+        finally:
+            executor.shutdown(wait=wait)
+            for session in workerSessions:
+                session.close()
 
     def onBadHttpResponse(self, request: str, result: requests.Response) -> NoReturn:
         message = None
@@ -86,19 +130,23 @@ class MattermostDriver:
         '''
         headers = {}
         if self.authorizationToken:
-            headers.update({'Token': self.authorizationToken})
+            headers.update({'Authorization': 'Bearer '+self.authorizationToken})
         r = self.session.post(self.configfile.hostname + self.API_PART + apiCommand, data, headers=headers)
         if r.status_code != 200:
             self.onBadHttpResponse(apiCommand, r)
         return r
 
-    def post(self, apiCommand: str, data: dict) -> dict:
+    def post(self, apiCommand: str, data: Union[dict, list]) -> Union[dict, list]:
         '''
             Common json passing returning request of POST variety.
         '''
         apiCommand = apiCommand.format(**self.context)
         r = self.postRaw(apiCommand, data=json.dumps(data))
-        return r.json()
+        r = r.json()
+        # We're guaranteeing certain types on output
+        if not isinstance(r, (dict, list)):
+            raise TypeError
+        return r
 
     def login(self):
         r = self.postRaw('users/login', json.dumps({
@@ -109,24 +157,56 @@ class MattermostDriver:
         self.authorizationToken = r.headers['Token']
 
     def getUserById(self, id: Id) -> User:
-        if id in self.cache.users:
-            return self.cache.users[id]
+        u = self.cache.users.get(id)
+        if u is not None:
+            return u
 
         userInfo = self.get('users/'+id)
         assert isinstance(userInfo, dict)
         u = User.fromMattermost(userInfo)
-        self.cache.users.update({u.id: u})
+        self.cache.addUser(u)
         return u
 
+    def getUsersByIds(self, ids: Iterable[Id], bufferSize: int = 100, strict: bool = True) -> Dict[Id, User]:
+        '''
+            Resolves multiple users at once, fetching those not cached yet in bulk requests.
+            Users missing in the bulk response are looked up one by one, failing like `getUserById`
+            if they can't be found. Without `strict`, they are left out of the result instead,
+            which suits prefetching users that may not be needed at all.
+        '''
+        res: Dict[Id, User] = {}
+        missing: List[Id] = []
+        queued: Set[Id] = set()
+        for id in ids:
+            u = self.cache.users.get(id)
+            if u is not None:
+                res[id] = u
+            elif id not in queued:
+                queued.add(id)
+                missing.append(id)
+
+        for start in range(0, len(missing), bufferSize):
+            userInfos = self.post('users/ids', missing[start:start+bufferSize])
+            assert isinstance(userInfos, list)
+            for userInfo in userInfos:
+                u = User.fromMattermost(userInfo)
+                self.cache.addUser(u)
+                res[u.id] = u
+        if strict:
+            for id in missing:
+                if id not in res:
+                    res[id] = self.getUserById(id)
+        return res
+
     def getUserByName(self, userName: str) -> User:
-        for user in self.cache.users.values():
-            if user.name == userName:
-                return user
+        u = self.cache.usersByName.get(userName)
+        if u is not None:
+            return u
 
         userInfo = self.get('users/username/'+userName)
         assert isinstance(userInfo, dict)
         u = User.fromMattermost(userInfo)
-        self.cache.users.update({u.id: u})
+        self.cache.addUser(u)
         return u
 
     def loadLocalUser(self) -> User:
@@ -141,7 +221,7 @@ class MattermostDriver:
         assert isinstance(teamInfos, list)
         for teamInfo in teamInfos:
             t = Team.fromMattermost(teamInfo)
-            self.cache.teams.update({t.id: t})
+            self.cache.teams[t.id] = t
         return self.cache.teams
 
     def getTeamById(self, teamId: Id) -> Team:
@@ -167,7 +247,7 @@ class MattermostDriver:
         assert isinstance(channelInfos, list)
         for chInfo in channelInfos:
             ch = Channel.fromMattermost(chInfo)
-            t.channels.update({ch.id: ch})
+            t.channels[ch.id] = ch
 
     def getChannelById(self, channelId: Id, teamId: Id = None) -> Channel:
         if teamId is None:
@@ -215,18 +295,18 @@ class MattermostDriver:
         if channel.members is not None:
             return
 
-        res = []
+        memberIds: List[Id] = []
 
         page = 0
         params = {
             'per_page': 100
         }
         while True:
-            params.update({'page': page})
+            params['page'] = page
             memberWindow = self.get(f'channels/{channel.id}/members', params)
             assert isinstance(memberWindow, list)
             for m in memberWindow:
-                res.append(self.getUserById(m['user_id']))
+                memberIds.append(m['user_id'])
 
             if len(memberWindow) == 0 or len(memberWindow) < 100:
                 break
@@ -234,7 +314,9 @@ class MattermostDriver:
             page += 1
             self.delay()
 
-        channel.members = res
+        # Members unknown so far are fetched in bulk, every member is resolved or lookup fails
+        users = self.getUsersByIds(memberIds)
+        channel.members = [users[id] for id in memberIds]
 
     def getPostById(self, postId: Id) -> Post:
         postInfo = self.get(f'/posts/{postId}')
@@ -262,7 +344,8 @@ class MattermostDriver:
             beforeTime: Optional[Time] = None, afterTime: Optional[Time] = None,
             bufferSize: int = 60, maxCount: int = 0, offset: int = 0,
             timeDirection: OrderDirection = OrderDirection.Asc,
-            onSkippedPost: Callable[[], None] = (lambda: None)
+            onSkippedPost: Callable[[], None] = (lambda: None),
+            prefetchUsers: bool = False, prefetcher: Optional[Executor] = None
             ) -> 'MattermostDriver.ProcessPostResult':
         '''
             Main function to load all channel's posts.
@@ -286,6 +369,12 @@ class MattermostDriver:
                     - start reading pages, after first page set afterPost to latest post and read page 0
                     - skip until afterTime filter matches, then start processing
                     - continue collecting until end, maxCount or beforeTime is reached
+
+            With `prefetchUsers`, authors of posts of each fetched page are loaded
+            into the cache in bulk before the posts get processed.
+            With `prefetcher`, next page is fetched by that executor while processing
+            the current one, at cost of possibly fetching one page in vain. The executor
+            is meant to be shared, so that its threads and connections get reused.
         '''
         if channel:
             channelId = channel.id
@@ -334,85 +423,115 @@ class MattermostDriver:
                 pageOffset = offset
             assert pageOffset < bufferSize # Sanity check
 
-        postHints = self.PostHints()
-        while True:
-            if page != 0:
-                params.update(page=page)
+        def fetchPostWindow(params: Dict[str, Any], delay: bool) -> dict:
+            if delay and self.configfile.throttlingLoopDelay:
+                sleep(self.configfile.throttlingLoopDelay / 1000) # Dump rate limit avoidance
             postWindow = self.get(f'channels/{channelId}/posts', params=params)
             assert isinstance(postWindow, dict)
-
-            stopReason: Optional[MattermostDriver.ProcessPostResult] = None
-
-            if timeDirection == OrderDirection.Desc:
-                for windowIndex, postId in enumerate(postWindow['order'][pageOffset:]):
-                    p = postWindow['posts'][postId]
-                    postHints.postIdBefore = postWindow['order'][windowIndex + 1] if windowIndex + 1 < len(postWindow['order']) else postWindow['prev_post_id'] if postWindow['prev_post_id'] != '' else None
-                    postHints.postIdAfter = postWindow['order'][windowIndex - 1] if windowIndex - 1 >= 0 else postWindow['next_post_id'] if postWindow['next_post_id'] != '' else None
-                    if ((afterPost and p['id'] == afterPost)
-                        or (afterTime and p['create_at'] < afterTime.timestamp)):
-                        stopReason = self.ProcessPostResult.ConditionReached
-                        break
-                    if maxCount and postHints.processedCount == maxCount:
-                        stopReason = self.ProcessPostResult.MaxCountReached
-                        break
-                    if beforeTime and p['create_at'] >= beforeTime.timestamp:
-                        onSkippedPost()
-                        continue
-                    processor(Post.fromMattermost(p), postHints)
-                    postHints.processedCount += 1
-            else: # timeDirection == OrderDirection.Asc
-                windowIndex = len(postWindow['order'])-pageOffset - 1
-                for postId in reversed(postWindow['order'][:windowIndex + 1]):
-                    p = postWindow['posts'][postId]
-                    postHints.postIdBefore = postWindow['order'][windowIndex + 1] if windowIndex + 1 < len(postWindow['order']) else postWindow['prev_post_id'] if postWindow['prev_post_id'] != '' else None
-                    postHints.postIdAfter = postWindow['order'][windowIndex - 1] if windowIndex - 1 >= 0 else postWindow['next_post_id'] if postWindow['next_post_id'] != '' else None
-                    windowIndex -= 1
-                    if ((beforePost and p['id'] == beforePost)
-                        or (beforeTime and p['create_at'] > beforeTime.timestamp)):
-                        stopReason = self.ProcessPostResult.ConditionReached
-                        break
-                    if maxCount and postHints.processedCount == maxCount:
-                        stopReason = self.ProcessPostResult.MaxCountReached
-                        break
-                    if afterTime and p['create_at'] <= afterTime.timestamp:
-                        onSkippedPost()
-                        continue
-                    processor(Post.fromMattermost(p), postHints)
-                    postHints.processedCount += 1
-
-            # No messages recieved?
-            if len(postWindow['order']) == 0:
-                # If we iterate from the end of the list, we may simply look beyond the end as channel message count is approximate
-                # (doesn't subtract deleted messages that aren't returned for common users)
-                if timeDirection == OrderDirection.Asc and not afterPost and page != 0:
-                    page -= 1
-                    continue
+            if prefetchUsers:
+                # Window includes posts never processed (such as thread roots), their authors may be gone
+                self.getUsersByIds({p['user_id'] for p in postWindow['posts'].values()}, strict=False)
+            return postWindow
+
+        nextWindow: Optional[Future] = None
+        # Delay is applied between pages, not before the first one
+        delayFetch = False
+        postHints = self.PostHints()
+        try:
+            while True:
+                if nextWindow is not None:
+                    postWindow = nextWindow.result()
+                    nextWindow = None
                 else:
-                    return self.ProcessPostResult.NoMorePosts
-
-            if stopReason is not None:
-                return stopReason
-            if len(postWindow['order']) == 0:
-                return self.ProcessPostResult.NoMorePosts
-            if maxCount and postHints.processedCount >= maxCount:
-                return self.ProcessPostResult.MaxCountReached
+                    if page != 0:
+                        params['page'] = page
+                    postWindow = fetchPostWindow(params, delay=delayFetch)
+
+                # Following page is known before processing this one, so it may get fetched meanwhile
+                if prefetcher is not None and len(postWindow['order']) != 0:
+                    nextParams = {key: value for key, value in params.items() if key != 'page'}
+                    if timeDirection == OrderDirection.Desc and postWindow['prev_post_id'] != '':
+                        nextParams.update(before=postWindow['order'][-1])
+                        nextWindow = prefetcher.submit(fetchPostWindow, nextParams, True)
+                    elif timeDirection == OrderDirection.Asc and postWindow['next_post_id'] != '':
+                        nextParams.update(after=postWindow['order'][0])
+                        nextWindow = prefetcher.submit(fetchPostWindow, nextParams, True)
+
+                stopReason: Optional[MattermostDriver.ProcessPostResult] = None
+
+                if timeDirection == OrderDirection.Desc:
+                    for windowIndex, postId in enumerate(postWindow['order'][pageOffset:]):
+                        p = postWindow['posts'][postId]
+                        postHints.postIdBefore = postWindow['order'][windowIndex + 1] if windowIndex + 1 < len(postWindow['order']) else postWindow['prev_post_id'] if postWindow['prev_post_id'] != '' else None
+                        postHints.postIdAfter = postWindow['order'][windowIndex - 1] if windowIndex - 1 >= 0 else postWindow['next_post_id'] if postWindow['next_post_id'] != '' else None
+                        if ((afterPost and p['id'] == afterPost)
+                            or (afterTime and p['create_at'] < afterTime.timestamp)):
+                            stopReason = self.ProcessPostResult.ConditionReached
+                            break
+                        if maxCount and postHints.processedCount == maxCount:
+                            stopReason = self.ProcessPostResult.MaxCountReached
+                            break
+                        if beforeTime and p['create_at'] >= beforeTime.timestamp:
+                            onSkippedPost()
+                            continue
+                        processor(Post.fromMattermost(p), postHints)
+                        postHints.processedCount += 1
+                else: # timeDirection == OrderDirection.Asc
+                    windowIndex = len(postWindow['order'])-pageOffset - 1
+                    for postId in reversed(postWindow['order'][:windowIndex + 1]):
+                        p = postWindow['posts'][postId]
+                        postHints.postIdBefore = postWindow['order'][windowIndex + 1] if windowIndex + 1 < len(postWindow['order']) else postWindow['prev_post_id'] if postWindow['prev_post_id'] != '' else None
+                        postHints.postIdAfter = postWindow['order'][windowIndex - 1] if windowIndex - 1 >= 0 else postWindow['next_post_id'] if postWindow['next_post_id'] != '' else None
+                        windowIndex -= 1
+                        if ((beforePost and p['id'] == beforePost)
+                            or (beforeTime and p['create_at'] > beforeTime.timestamp)):
+                            stopReason = self.ProcessPostResult.ConditionReached
+                            break
+                        if maxCount and postHints.processedCount == maxCount:
+                            stopReason = self.ProcessPostResult.MaxCountReached
+                            break
+                        if afterTime and p['create_at'] <= afterTime.timestamp:
+                            onSkippedPost()
+                            continue
+                        processor(Post.fromMattermost(p), postHints)
+                        postHints.processedCount += 1
+
+                # No messages recieved?
+                if len(postWindow['order']) == 0:
+                    # If we iterate from the end of the list, we may simply look beyond the end as channel message count is approximate
+                    # (doesn't subtract deleted messages that aren't returned for common users)
+                    if timeDirection == OrderDirection.Asc and not afterPost and page != 0:
+                        page -= 1
+                        continue
+                    else:
+                        return self.ProcessPostResult.NoMorePosts
 
-            if timeDirection == OrderDirection.Desc:
-                if postWindow['prev_post_id'] == '':
-                    return self.ProcessPostResult.NoMorePosts
-                params.update(before = postWindow['order'][-1])
-            else:
-                if postWindow['next_post_id'] == '':
+                if stopReason is not None:
+                    return stopReason
+                if len(postWindow['order']) == 0:
                     return self.ProcessPostResult.NoMorePosts
-                params.update(after = postWindow['order'][0])
-
-            if page != 0:
-                page = 0
-                del params['page']
-            if pageOffset != 0:
-                pageOffset = 0
-            if self.configfile.throttlingLoopDelay:
-                sleep(self.configfile.throttlingLoopDelay / 1000) # Dump rate limit avoidance
+                if maxCount and postHints.processedCount >= maxCount:
+                    return self.ProcessPostResult.MaxCountReached
+
+                if timeDirection == OrderDirection.Desc:
+                    if postWindow['prev_post_id'] == '':
+                        return self.ProcessPostResult.NoMorePosts
+                    params.update(before = postWindow['order'][-1])
+                else:
+                    if postWindow['next_post_id'] == '':
+                        return self.ProcessPostResult.NoMorePosts
+                    params.update(after = postWindow['order'][0])
+
+                if page != 0:
+                    page = 0
+                    del params['page']
+                if pageOffset != 0:
+                    pageOffset = 0
+                delayFetch = True
+        finally:
+            if nextWindow is not None:
+                # Prefetched page may end up unused if processing stops early, it's not waited for
+                nextWindow.cancel()
 
     def getPosts(self, channel: Channel = None, *args, **kwargs) -> List[Post]:
         result = []
@@ -430,13 +549,13 @@ class MattermostDriver:
         page = 0
         while True:
             if maxCount and maxCount - recieved < bufferSize:
-                params.update({"per_page": maxCount - recieved})
-            params.update({"page": page})
+                params["per_page"] = maxCount - recieved
+            params["page"] = page
             emojiWindow = self.get('emoji', params)
             assert isinstance(emojiWindow, list)
             for emojiInfo in emojiWindow:
                 e = Emoji.fromMattermost(emojiInfo)
-                self.cache.emojis.update({e.id: e})
+                self.cache.addEmoji(e)
                 processor(e)
             recieved += len(emojiWindow)
             if len(emojiWindow) < bufferSize or (maxCount and recieved >= maxCount):
@@ -451,21 +570,24 @@ class MattermostDriver:
         self.processEmojiList(processor=process, *args, **kwargs)
         return result
 
+    def loadEmojiCache(self):
+        if self.cache.emojisLoaded:
+            return
+        with self.cacheLock:
+            if not self.cache.emojisLoaded:
+                self.getEmojiList()
+                self.cache.emojisLoaded = True
+
     def getEmojiById(self, emojiId: Id) -> Emoji:
-        if len(self.cache.emojis) == 0:
-            self.getEmojiList()
+        self.loadEmojiCache()
         if emojiId in self.cache.emojis:
             return self.cache.emojis[emojiId]
         else:
             raise KeyError
 
     def getEmojiByName(self, emojiName: str) -> Emoji:
-        if len(self.cache.emojis) == 0:
-            self.getEmojiList()
-        for emoji in self.cache.emojis.values():
-            if emoji.name == emojiName:
-                return emoji
-        raise KeyError
+        self.loadEmojiCache()
+        return self.cache.emojisByName[emojiName]
 
     def getEmojiUrl(self, emoji: Emoji) -> str:
         return f'emoji/{emoji.id}/image'
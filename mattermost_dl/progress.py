@@ -6,6 +6,7 @@
 from .common import *
 
 from copy import copy
+from threading import Lock, Timer
 from time import monotonic_ns as clock
 
 class VisualizationMode(Enum):
@@ -19,7 +20,7 @@ class ProgressSettings:
 
 class ProgressReporter:
     def __init__(self, io: TextIO, settings: ProgressSettings = ProgressSettings(), header: str = '', footer: str = '',
-            contentPadding: int = 0, contentAlignLeft: bool = True, updateIntervalMs: int = 500):
+            contentPadding: int = 0, contentAlignLeft: bool = True, updateIntervalMs: int = 500, redrawIntervalMs: int = 50):
         self.io: TextIO = io
         self.settings: ProgressSettings = copy(settings)
         self.header: str = header
@@ -29,6 +30,14 @@ class ProgressReporter:
         self.updateIntervalNs: int = 1000000 * updateIntervalMs
         # Time point at which next update of noninteractive terminal may happen
         self.nextUpdate: int = 0
+        # Interactive terminal is redrawn at limited rate too, as updates may come much faster than anyone can read
+        self.redrawIntervalNs: int = 1000000 * redrawIntervalMs
+        self.nextRedraw: int = 0
+        # Latest content skipped due to redraw rate, shown once the interval passes
+        self.pendingContent: Optional[str] = None
+        self.pendingRedraw: Optional[Timer] = None
+        # Pending content is drawn from timer thread
+        self.drawLock = Lock()
 
         if not settings.forceMode:
             # Outside terminal we use simple basic progress reporting.
@@ -42,9 +51,33 @@ class ProgressReporter:
         else:
             self.nextUpdate = clock() + self.updateIntervalNs
     def update(self, content: str, redraw: bool = False):
-        if self.settings.mode == VisualizationMode.DumbTerminal:
-            if clock() <= self.nextUpdate:
-                return
+        with self.drawLock:
+            if self.settings.mode == VisualizationMode.DumbTerminal:
+                if clock() <= self.nextUpdate:
+                    return
+            elif not redraw:
+                now = clock()
+                if now < self.nextRedraw:
+                    self.pendingContent = content
+                    if self.pendingRedraw is None:
+                        # Shown even if no other update comes, such as before long step
+                        self.pendingRedraw = Timer((self.nextRedraw - now) / 1e9, self.drawPending)
+                        self.pendingRedraw.daemon = True
+                        self.pendingRedraw.start()
+                    return
+                self.nextRedraw = now + self.redrawIntervalNs
+            self.draw(content, redraw)
+    def drawPending(self):
+        with self.drawLock:
+            self.pendingRedraw = None
+            if self.pendingContent is not None:
+                self.nextRedraw = clock() + self.redrawIntervalNs
+                self.draw(self.pendingContent)
+    def draw(self, content: str, redraw: bool = False):
+        self.pendingContent = None
+        if self.pendingRedraw is not None:
+            self.pendingRedraw.cancel()
+            self.pendingRedraw = None
         padding = max(self.contentPadding-len(content), 0)
         if padding:
             if self.contentAlignLeft:
@@ -63,9 +96,13 @@ class ProgressReporter:
             self.io.flush()
     def close(self):
         if self.settings.mode == VisualizationMode.AnsiEscapes:
-            # Move to start of new line
-            self.io.write('\n')
-            self.io.flush()
+            with self.drawLock:
+                if self.pendingContent is not None:
+                    # Final state should be always visible
+                    self.draw(self.pendingContent)
+                # Move to start of new line
+                self.io.write('\n')
+                self.io.flush()
 
 class ProgressBar:
     '''
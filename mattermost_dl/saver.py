@@ -5,14 +5,16 @@
 from .common import *
 
 from .bo import *
-from .config import ChannelOptions, ConfigFile, GroupChannelSpec, LogVerbosity, OrderDirection, TeamSpec
+from .config import ChannelOptions, ChannelSpec, ConfigFile, GroupChannelSpec, LogVerbosity, OrderDirection, TeamSpec
 from .driver import MattermostDriver
 from . import progress
 from .recovery import RReuse, RecoveryArbiter, RBackup, RDelete, RSkipDownload
-from .store import ChannelFileInfo, ChannelHeader, PostOrdering, PostStorage
+from .store import ChannelFileInfo, ChannelHeader, PostOrdering, PostStorage, dumpJson, writeFileAtomically
 
-import json
+from concurrent.futures import Executor, Future, as_completed
+from functools import lru_cache, partial
 from mimetypes import guess_extension
+from threading import Event, Lock
 
 @dataclass
 class ChannelRequest:
@@ -32,6 +34,13 @@ class SavingFailed(Exception):
     '''
     pass
 
+class DownloadCancelled(KeyboardInterrupt):
+    '''
+        Stops channels processed in parallel after the download as a whole was interrupted or failed.
+        Treated as an interruption, so channel rollback behaves the same as on Ctrl-C.
+    '''
+    pass
+
 
 class Saver:
     '''
@@ -49,44 +58,95 @@ class Saver:
         self.driver: MattermostDriver = driver
         self.recoveryArbiter: RecoveryArbiter = recoveryArbiter
         self.user: User # Conveniency, fetched on call
-
-    def jsonDumpToFile(self, obj, fp):
-        def fallback(obj):
-            if hasattr(obj, 'toStore'):
-                return obj.toStore()
-            return str(obj)
-
-        json.dump(obj, fp, default=fallback, ensure_ascii=False)
+        # Enrichment happens for every post, so the configuration is consulted only once
+        self.enrichEmoji: Callable[[Emoji], None]
+        self.enrichPostReaction: Callable[[PostReaction], None]
+        self.enrichPost: Callable[[Post], None]
+        if configfile.verboseHumanFriendlyPosts:
+            self.enrichEmoji = self.enrichEmojiHumanFriendly
+            self.enrichPostReaction = self.enrichPostReactionHumanFriendly
+            self.enrichPost = self.enrichPostHumanFriendly
+        else:
+            self.enrichEmoji = self.enrichPostReaction = self.enrichPost = self.enrichNothing
+        # Downloads in progress by target path, shared by channels processed in parallel
+        self.fileDownloads: Dict[str, Future] = {}
+        self.fileDownloadsLock = Lock()
+        # Set when channels processed in parallel shall stop
+        self.cancelled = Event()
+        # Direct channels by their internal name, built lazily once channels are loaded
+        self.directChannelIndex: Optional[Dict[str, Channel]] = None
+        # Fetches following pages of posts for all channels, available while channels are processed
+        self.postPrefetcher: Optional[Executor] = None
+
+    def getUserLocatorKey(self, locator: EntityLocator) -> Tuple[str, str]:
+        kind, value = locator.key()
+        # Users have no display name distinct from the internal one
+        return ('id', value) if kind == 'id' else ('name', value)
 
     def getUserByLocator(self, locator: EntityLocator) -> User:
-        if hasattr(locator, 'id'):
-            return self.driver.getUserById(locator.id)
-        elif hasattr(locator, 'name'):
-            return self.driver.getUserByName(locator.name)
-        elif hasattr(locator, 'internalName'):
-            return self.driver.getUserByName(locator.internalName)
+        kind, value = self.getUserLocatorKey(locator)
+        if kind == 'id':
+            return self.driver.getUserById(Id(value))
         else:
-            raise ValueError
+            return self.driver.getUserByName(value)
 
-    def matchGroupChannel(self, channel: Channel, locator: Union[Id, FrozenSet[EntityLocator]]) -> bool:
-        if isinstance(locator, str):
-            return channel.id == locator
-        else:
-            assert isinstance(locator, frozenset)
-            if channel.members is None:
-                self.driver.loadChannelMembers(channel)
-                assert channel.members is not None
-            users = set(self.getUserByLocator(userLocator)
-                for userLocator in locator
-            )
-            users.add(self.user)
-            return users == set(u for u in channel.members)
+    def getGroupMemberKey(self, locator: FrozenSet[EntityLocator]) -> FrozenSet[Id]:
+        '''
+            Resolves group locator given by member list into set of member ids, including current user,
+            comparable with `indexGroupChannelsByMembers` keys.
+        '''
+        return frozenset(self.getUserByLocator(userLocator).id for userLocator in locator) | {self.user.id}
+
+    @staticmethod
+    def indexGroupChannelsByMembers(channels: Iterable[Channel]) -> Dict[FrozenSet[Id], Channel]:
+        '''
+            Maps group channels by set of ids of their members. Members are expected to be already loaded.
+        '''
+        index: Dict[FrozenSet[Id], Channel] = {}
+        for channel in channels:
+            assert channel.members is not None
+            index[frozenset(u.id for u in channel.members)] = channel
+        return index
+
+    def getDirectChannelIndex(self, teams: Dict[Id, Team]) -> Dict[str, Channel]:
+        '''
+            Returns all available direct channels keyed by their internal name.
+            Direct channels are shared by all teams, so each channel is present only once.
+        '''
+        if self.directChannelIndex is None:
+            self.directChannelIndex = {channel.internalName: channel
+                for team in teams.values()
+                    for channel in team.channels.values()
+                        if channel.type == ChannelType.Direct
+            }
+        return self.directChannelIndex
+
+    EntityWithLocators = TypeVar('EntityWithLocators', Team, Channel)
+    @staticmethod
+    def indexByLocatorKeys(entities: Iterable[EntityWithLocators]) -> Dict[Tuple[str, str], List[EntityWithLocators]]:
+        '''
+            Indexes teams or channels by all identificators EntityLocator may refer them by.
+            Displayed names don't have to be unique, so each key may refer to multiple entities.
+        '''
+        index: Dict[Tuple[str, str], List[Saver.EntityWithLocators]] = {}
+        for entity in entities:
+            for key in (('id', entity.id), ('internalName', entity.internalName), ('name', entity.name)):
+                index.setdefault(cast(Tuple[str, str], key), []).append(entity)
+        return index
 
     def getWantedUsers(self) -> List[Tuple[User, ChannelOptions]]:
         userIds = set()
+        # Duplicate locators are caught before resolving them, as that may need a request to the server
+        seenLocators: Set[Tuple[str, str]] = set()
         res = []
         for userSpec in self.configfile.explicitUsers:
-            u = self.getUserByLocator(userSpec.locator)
+            locator = userSpec.locator
+            locatorKey = self.getUserLocatorKey(locator)
+            if locatorKey in seenLocators:
+                logging.warning(f"Explicitly requesting direct messages for user {locatorKey[1]} more than once.")
+                continue
+            seenLocators.add(locatorKey)
+            u = self.getUserByLocator(locator)
             if u.id in userIds:
                 logging.warning(f"Explicitly requesting direct messages for user {u.name} more than once.")
             else:
@@ -94,7 +154,7 @@ class Saver:
                 res.append((u, userSpec.opts))
         return res
 
-    def getWantedGlobalChannels(self) -> Tuple[Dict[User, ChannelRequest], Set[ChannelRequest]]:
+    def getWantedGlobalChannels(self, teams: Dict[Id, Team]) -> Tuple[Dict[User, ChannelRequest], Set[ChannelRequest]]:
         '''
             Collects a list of channels requested by configfile that aren't scoped under Team.
             Returns pair representing channel requests for users and groups respectively.
@@ -103,27 +163,64 @@ class Saver:
         wantedGroupChannels: Set[ChannelRequest] = set()
         explicitDirectChannelNames = {self.driver.getDirectChannelNameByUserId(u.id): (u, opts) for u, opts in self.getWantedUsers()}
         matchedGroupChannels: Set[GroupChannelSpec] = set()
-        for team in self.driver.getTeams().values():
-            for channel in team.channels.values():
-                if channel.type == ChannelType.Direct:
-                    # If we don't have this channel already
-                    if channel.id not in (ch.metadata.id for ch in wantedDirectChannels.values()):
-                        if channel.internalName in explicitDirectChannelNames:
-                            u, opts = explicitDirectChannelNames[channel.internalName]
-                            wantedDirectChannels.update({u: ChannelRequest(config=opts, metadata=channel)})
-                            del explicitDirectChannelNames[channel.internalName]
-                        elif self.configfile.miscDirectChannels:
-                            otherUser = self.driver.getUserById(self.driver.getUserIdFromDirectChannelName(channel.internalName))
-                            wantedDirectChannels.update({otherUser: ChannelRequest(config=self.configfile.directChannelDefaults, metadata=channel)})
-                elif channel.type == ChannelType.Group:
-                    for wch in self.configfile.explicitGroups:
-                        if self.matchGroupChannel(channel, wch.locator):
-                            wantedGroupChannels.add(ChannelRequest(config=wch.opts, metadata=channel))
-                            matchedGroupChannels.add(wch)
-                            break
-                    else:
-                        if self.configfile.miscGroupChannels:
-                            wantedGroupChannels.add(ChannelRequest(config=self.configfile.groupChannelDefaults, metadata=channel))
+
+        directChannels = self.getDirectChannelIndex(teams)
+        if self.configfile.miscDirectChannels:
+            for channelName, channel in directChannels.items():
+                if channelName in explicitDirectChannelNames:
+                    u, opts = explicitDirectChannelNames[channelName]
+                    wantedDirectChannels[u] = ChannelRequest(config=opts, metadata=channel)
+                    del explicitDirectChannelNames[channelName]
+                else:
+                    otherUser = self.driver.getUserById(self.driver.getUserIdFromDirectChannelName(channelName))
+                    wantedDirectChannels[otherUser] = ChannelRequest(config=self.configfile.directChannelDefaults, metadata=channel)
+        else:
+            # Only explicitly requested channels are needed, so we look them up instead of filtering all channels
+            for channelName, (u, opts) in list(explicitDirectChannelNames.items()):
+                if channelName in directChannels:
+                    wantedDirectChannels[u] = ChannelRequest(config=opts, metadata=directChannels[channelName])
+                    del explicitDirectChannelNames[channelName]
+
+        # Like direct channels, group channels are shared by all teams
+        groupChannels = {channel.id: channel
+            for team in teams.values()
+                for channel in team.channels.values()
+                    if channel.type == ChannelType.Group
+        }
+        # Matching by member list needs members of all group channels, so we load them all upfront
+        membersNeeded = any(not isinstance(wch.locator, str) for wch in self.configfile.explicitGroups)
+        if membersNeeded:
+            unloadedChannels = [channel for channel in groupChannels.values() if channel.members is None]
+            if self.configfile.parallelism == 1:
+                for channel in unloadedChannels:
+                    self.driver.loadChannelMembers(channel)
+            else:
+                # Every channel needs its own requests, so they are waited for concurrently
+                with self.driver.workerPool(self.configfile.parallelism or 8) as executor:
+                    list(executor.map(self.driver.loadChannelMembers, unloadedChannels))
+
+        # Users requested by id are fetched in bulk ahead of resolving the locators
+        self.driver.getUsersByIds(Id(userLocator.id)
+            for wch in self.configfile.explicitGroups if not isinstance(wch.locator, str)
+                for userLocator in wch.locator if userLocator.key()[0] == 'id')
+        # Each locator is resolved once and looked up, rather than compared with every channel
+        groupsByMembers = self.indexGroupChannelsByMembers(groupChannels.values()) if membersNeeded else {}
+        matchedChannelIds: Set[Id] = set()
+        for wch in self.configfile.explicitGroups:
+            if isinstance(wch.locator, str):
+                channel = groupChannels.get(wch.locator)
+            else:
+                channel = groupsByMembers.get(self.getGroupMemberKey(wch.locator))
+            # First matching locator decides options of the channel
+            if channel is not None and channel.id not in matchedChannelIds:
+                wantedGroupChannels.add(ChannelRequest(config=wch.opts, metadata=channel))
+                matchedGroupChannels.add(wch)
+                matchedChannelIds.add(channel.id)
+
+        if self.configfile.miscGroupChannels:
+            for channel in groupChannels.values():
+                if channel.id not in matchedChannelIds:
+                    wantedGroupChannels.add(ChannelRequest(config=self.configfile.groupChannelDefaults, metadata=channel))
 
         # Have not found all channels?
         for user, _ in explicitDirectChannelNames.values():
@@ -133,68 +230,118 @@ class Saver:
                 logging.warning(f'Found no group channel via locator {wch.locator}.')
         return wantedDirectChannels, wantedGroupChannels
 
-    def getWantedPerTeamChannels(self) -> Dict[Team, List[ChannelRequest]]:
+    def getWantedPerTeamChannels(self, teams: Dict[Id, Team]) -> Dict[Team, List[ChannelRequest]]:
         if self.configfile.miscTeams is False and len(self.configfile.explicitTeams) == 0:
             return {}
 
         res: Dict[Team, List[ChannelRequest]] = {}
-        teams = self.driver.getTeams()
 
         def getChannelsForTeam(team: Team, wantedTeam: TeamSpec) -> List[ChannelRequest]:
-            channels = []
-            explicitPublicLocators = {ch.locator for ch in wantedTeam.explicitPublicChannels}
-            explicitPrivateLocators = {ch.locator for ch in wantedTeam.explicitPrivateChannels}
+            channelIndex = self.indexByLocatorKeys(team.channels.values())
+            explicitRequests: Dict[Id, ChannelRequest] = {}
+
+            def requestExplicitChannels(wantedChannels: List[ChannelSpec], channelType: ChannelType, kind: str):
+                for wch in wantedChannels:
+                    matched = False
+                    for availableChannel in channelIndex.get(wch.locator.key(), ()):
+                        # Channel matching multiple locators is requested by the first one
+                        if availableChannel.type == channelType and availableChannel.id not in explicitRequests:
+                            explicitRequests[availableChannel.id] = ChannelRequest(config=wch.opts, metadata=availableChannel)
+                            matched = True
+                    if not matched:
+                        logging.warning(f'Found no requested {kind} channel on team {team.internalName} ({team.name}) via locator {wch.locator}.')
+
+            requestExplicitChannels(wantedTeam.explicitPublicChannels, ChannelType.Open, 'public')
+            requestExplicitChannels(wantedTeam.explicitPrivateChannels, ChannelType.Private, 'private')
 
+            channels = []
             for availableChannel in team.channels.values():
-                if availableChannel.type == ChannelType.Open:
-                    for wch in wantedTeam.explicitPublicChannels:
-                        if availableChannel.match(wch.locator):
-                            channels.append(ChannelRequest(config=wch.opts, metadata=availableChannel))
-                            explicitPublicLocators.remove(wch.locator)
-                            break
-                    else:
-                        if wantedTeam.miscPublicChannels:
-                            channels.append(ChannelRequest(config=wantedTeam.publicChannelDefaults, metadata=availableChannel))
+                if availableChannel.id in explicitRequests:
+                    channels.append(explicitRequests[availableChannel.id])
+                elif availableChannel.type == ChannelType.Open:
+                    if wantedTeam.miscPublicChannels:
+                        channels.append(ChannelRequest(config=wantedTeam.publicChannelDefaults, metadata=availableChannel))
                 elif availableChannel.type == ChannelType.Private:
-                    for wch in wantedTeam.explicitPrivateChannels:
-                        if availableChannel.match(wch.locator):
-                            channels.append(ChannelRequest(config=wch.opts, metadata=availableChannel))
-                            explicitPrivateLocators.remove(wch.locator)
-                            break
-                    else:
-                        if wantedTeam.miscPrivateChannels:
-                            channels.append(ChannelRequest(config=wantedTeam.privateChannelDefaults, metadata=availableChannel))
-            for loc in explicitPublicLocators:
-                logging.warning(f'Found no requested public channel on team {team.internalName} ({team.name}) via locator {loc}.')
-            for loc in explicitPrivateLocators:
-                logging.warning(f'Found no requested private channel on team {team.internalName} ({team.name}) via locator {loc}.')
+                    if wantedTeam.miscPrivateChannels:
+                        channels.append(ChannelRequest(config=wantedTeam.privateChannelDefaults, metadata=availableChannel))
             return channels
 
-        explicitTeamLocators: Set[EntityLocator] = {t.locator for t in self.configfile.explicitTeams}
+        teamIndex = self.indexByLocatorKeys(teams.values())
+        wantedTeams: Dict[Id, TeamSpec] = {}
+        explicitTeamLocators: List[EntityLocator] = []
+        for wantedTeam in self.configfile.explicitTeams:
+            matched = False
+            for availableTeam in teamIndex.get(wantedTeam.locator.key(), ()):
+                # Team matching multiple locators is requested by the first one
+                if availableTeam.id not in wantedTeams:
+                    wantedTeams[availableTeam.id] = wantedTeam
+                    matched = True
+            if not matched:
+                explicitTeamLocators.append(wantedTeam.locator)
+
         for availableTeam in teams.values():
-            for wantedTeam in self.configfile.explicitTeams:
-                if availableTeam.match(wantedTeam.locator):
-                    res[availableTeam] = getChannelsForTeam(availableTeam, wantedTeam)
-                    explicitTeamLocators.remove(wantedTeam.locator)
-                    break
-            else:
-                if self.configfile.miscTeams:
-                    channels = []
-                    for ch in availableTeam.channels.values():
-                        if ch.type == ChannelType.Open:
-                            channels.append(ChannelRequest(config=self.configfile.publicChannelDefaults, metadata=ch))
-                        elif ch.type == ChannelType.Private:
-                            channels.append(ChannelRequest(config=self.configfile.privateChannelDefaults, metadata=ch))
-                    res[availableTeam] = channels
+            if availableTeam.id in wantedTeams:
+                res[availableTeam] = getChannelsForTeam(availableTeam, wantedTeams[availableTeam.id])
+            elif self.configfile.miscTeams:
+                channels = []
+                for ch in availableTeam.channels.values():
+                    if ch.type == ChannelType.Open:
+                        channels.append(ChannelRequest(config=self.configfile.publicChannelDefaults, metadata=ch))
+                    elif ch.type == ChannelType.Private:
+                        channels.append(ChannelRequest(config=self.configfile.privateChannelDefaults, metadata=ch))
+                res[availableTeam] = channels
         for loc in explicitTeamLocators:
             logging.error(f'Team requested by {loc} was not found!')
         return res
 
     def storeFile(self, url: str, filename: str, directoryName: Path, suffix: Optional[str] = None, redownload: bool = False) -> str:
+        '''
+            Downloads file into given directory, returning its name with suffix.
+            Concurrent requests for the same file share single download while it's in progress.
+        '''
         if '/' in filename:
             logging.warning(f'Refusing to store file with name "{filename}"')
             raise ValueError
 
+        key = str(directoryName / filename)
+        with self.fileDownloadsLock:
+            download = self.fileDownloads.get(key)
+            isOwner = download is None
+            if download is None:
+                download = self.fileDownloads[key] = Future()
+        if not isOwner:
+            return download.result()
+
+        try:
+            storedFilename = self.downloadFile(url, filename, directoryName, suffix, redownload)
+        except BaseException as e:
+            download.set_exception(e)
+            raise
+        else:
+            download.set_result(storedFilename)
+        finally:
+            # Only downloads in flight are shared, later requests decide about redownloading on their own
+            with self.fileDownloadsLock:
+                del self.fileDownloads[key]
+        return storedFilename
+
+    CONTENT_TYPE_PATTERN = re.compile(r'^[^/]+/(\S+)$')
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def guessSuffix(contentType: str) -> str:
+        '''Guesses file suffix from content type, results are cached as the types repeat a lot.'''
+        suffix = guess_extension(contentType)
+        if suffix is None:
+            crudeParse = Saver.CONTENT_TYPE_PATTERN.match(contentType)
+            if crudeParse is not None:
+                suffix = '.'+crudeParse[1]
+            else:
+                logging.warning(f"Can't guess extension from content type '{contentType}', leaving empty.")
+                suffix = ''
+        return suffix
+
+    def downloadFile(self, url: str, filename: str, directoryName: Path, suffix: Optional[str], redownload: bool) -> str:
         httpResponse = self.driver.getRaw(url)
         if suffix is None:
             if 'content-type' in httpResponse.headers:
@@ -202,14 +349,7 @@ class Saver:
                 suffixIdx = contentType.find(';')
                 if suffixIdx != -1:
                     contentType = contentType[:suffixIdx]
-                suffix = guess_extension(contentType)
-                if suffix is None:
-                    crudeParse = re.match(r'^[^/]+/(\S+)$', contentType)
-                    if crudeParse is not None:
-                        suffix = '.'+crudeParse[1]
-                    else:
-                        logging.warning(f"Can't guess extension from content type '{contentType}', leaving empty.")
-                        suffix = ''
+                suffix = self.guessSuffix(contentType)
             else:
                 suffix = ''
         assert isinstance(suffix, str)
@@ -233,7 +373,8 @@ class Saver:
         dirName: Path = self.configfile.outputDirectory / directoryName
         hasFolder = dirName.is_dir()
         if hasFolder:
-            files: Dict[str, str] = {Path(name).stem: name for name in os.listdir(dirName)}
+            # Plain string split, as constructing Path for every stored file adds up in large folders
+            files: Dict[str, str] = {os.path.splitext(name)[0]: name for name in os.listdir(dirName)}
         else:
             files = {}
 
@@ -249,26 +390,47 @@ class Saver:
             # Reporter should be never accessed in this case, but we want clear type for linting
             reporter = cast(progress.ProgressReporter, UnboundLocalError)
 
-        for i, entity in enumerate(entities):
+        def download(entity: Saver.FileEntity, filename: str) -> str:
+            self.checkCancelled()
+            return self.storeFile(
+                url=getUrlFromEntity(entity), filename=filename, directoryName=dirName,
+                suffix=getSuffixHint(entity), redownload=redownload)
+
+        # Downloads that are needed, in order of entities
+        pending: List[Tuple[Saver.FileEntity, str]] = []
+        for entity in entities:
             filename = getFilenameFromEntity(entity)
             if filename in files:
                 storeFilename(entity, files[filename])
                 continue
             if not shouldDownload(entity):
                 continue
-            url = getUrlFromEntity(entity)
-
-            if not hasFolder:
-                dirName.mkdir()
-                hasFolder = True
+            pending.append((entity, filename))
 
-            suffix = getSuffixHint(entity)
-            storeFilename(entity, self.storeFile(
-                url=url, filename=filename, directoryName=dirName,
-                suffix=suffix, redownload=redownload))
+        if pending and not hasFolder:
+            # Other channels downloaded in parallel may share the folder
+            dirName.mkdir(exist_ok=True)
 
-            if showProgressReport:
-                reporter.update(str(i+1))
+        skippedCount = len(entities) - len(pending)
+        if self.configfile.fileParallelism == 1:
+            for i, (entity, filename) in enumerate(pending):
+                storeFilename(entity, download(entity, filename))
+                if showProgressReport:
+                    reporter.update(str(skippedCount+i+1))
+        else:
+            # Files are independent and downloading them is bound by latency
+            with self.driver.workerPool(self.configfile.fileParallelism or 8) as executor:
+                futures = {executor.submit(download, entity, filename): entity for entity, filename in pending}
+                try:
+                    for i, future in enumerate(as_completed(futures)):
+                        # Entities are updated only from this thread
+                        storeFilename(futures[future], future.result())
+                        if showProgressReport:
+                            reporter.update(str(skippedCount+i+1))
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
         if showProgressReport:
             reporter.close()
         logging.info(f"Processed all {entitiesName}.")
@@ -319,25 +481,32 @@ class Saver:
             redownload=redownload
         )
 
-    def enrichEmoji(self, emoji: Emoji):
-        if self.configfile.verboseHumanFriendlyPosts:
-            emoji.creatorName = self.driver.getUserById(emoji.creatorId).name
+    # Enrichment variants, selected by configuration in constructor
 
-    def enrichPostReaction(self, reaction: PostReaction):
-        if self.configfile.verboseHumanFriendlyPosts:
-            reaction.userName = self.driver.getUserById(reaction.userId).name
+    def enrichNothing(self, entity: Any):
+        pass
+
+    def enrichEmojiHumanFriendly(self, emoji: Emoji):
+        emoji.creatorName = self.driver.getUserById(emoji.creatorId).name
+
+    def enrichPostReactionHumanFriendly(self, reaction: PostReaction):
+        reaction.userName = self.driver.getUserById(reaction.userId).name
 
     # Note: the post gets mutated, so we better not pass persistent copy
-    def enrichPost(self, post: Post):
-        if self.configfile.verboseHumanFriendlyPosts:
-            post.userName = self.driver.getUserById(post.userId).name
-        if len(post.reactions) != 0:
-            for reaction in post.reactions:
-                self.enrichPostReaction(reaction)
+    def enrichPostHumanFriendly(self, post: Post):
+        post.userName = self.driver.getUserById(post.userId).name
+        for reaction in post.reactions:
+            self.enrichPostReaction(reaction)
+
+    def writePost(self, post: Post, output: BinaryIO):
+        '''Appends post as a single line of the post storage.'''
+        output.write(dumpJson(post.toStore()) + b'\n')
 
     def showProgressReport(self) -> bool:
+        # Reports of channels processed in parallel would overwrite each other
         return (self.configfile.verbosity == LogVerbosity.Normal
-            and self.configfile.reportProgress.mode != progress.VisualizationMode.DumbTerminal)
+            and self.configfile.reportProgress.mode != progress.VisualizationMode.DumbTerminal
+            and self.configfile.parallelism == 1)
 
     def reduceChannelDownloadConstraints(self, channelOptions: ChannelOptions, storage: PostStorage, lastChannelMessageTime: Time) -> Union[bool, ChannelOptions]:
         '''
@@ -673,22 +842,22 @@ class Saver:
 
         if options.postLimit > 0 or options.postSessionLimit > 0:
             if options.postLimit == -1:
-                params.update(maxCount=options.postSessionLimit)
+                params['maxCount'] = options.postSessionLimit
             elif options.postSessionLimit == -1:
-                params.update(maxCount=options.postLimit)
+                params['maxCount'] = options.postLimit
             else:
-                params.update(maxCount=min(options.postLimit, options.postSessionLimit))
+                params['maxCount'] = min(options.postLimit, options.postSessionLimit)
 
         if options.postsAfterId:
-            params.update(afterPost=options.postsAfterId)
+            params['afterPost'] = options.postsAfterId
         elif options.postsAfterTime:
             if options.postsBeforeTime and options.postsBeforeTime < options.postsAfterTime: # type: ignore
                 return None
-            params.update(afterTime=options.postsAfterTime)
+            params['afterTime'] = options.postsAfterTime
         if options.postsBeforeId:
-            params.update(beforePost=options.postsBeforeId)
+            params['beforePost'] = options.postsBeforeId
         elif options.postsBeforeTime:
-            params.update(beforeTime=options.postsBeforeTime)
+            params['beforeTime'] = options.postsBeforeTime
 
         return truncateArchive, params
 
@@ -834,22 +1003,28 @@ class Saver:
     def processChannelAuxiliaries(self, channelOutfile: str, header: ChannelHeader, options: ChannelOptions, usedAttachments: List[FileAttachment]):
         '''Fetches additional data beside posts for given channel.'''
         if options.emojiMetadata:
-            for emoji in header.usedEmojis:
+            for emoji in header.usedEmojis.values():
                 self.enrichEmoji(emoji)
         if options.downloadEmoji and not self.configfile.downloadAllEmojis:
-            self.processEmoji('emojis', emojis=header.usedEmojis)
+            self.processEmoji('emojis', emojis=header.usedEmojis.values())
 
         if options.downloadAttachments and len(usedAttachments) > 0:
             self.processAttachments(channelOutfile+'--files', channelOpts=options, attachments=usedAttachments)
 
         if options.downloadAvatars:
-            self.processAvatars('avatars', users=header.usedUsers)
+            self.processAvatars('avatars', users=header.usedUsers.values())
+
 
+    def checkCancelled(self):
+        if self.cancelled.is_set():
+            raise DownloadCancelled
 
     def processChannel(self, channelOutfile: str, header: ChannelHeader, channelRequest: ChannelRequest):
         channel, options = channelRequest.metadata, channelRequest.config
+        self.checkCancelled()
 
         headerFilename, dataFilename = self.makeArchiveFilenames(channelOutfile)
+        backupOutfile = channelOutfile + '--backup'
         showProgressReport = self.showProgressReport()
 
         def backupAltNames() -> Generator[str, None, None]:
@@ -878,7 +1053,7 @@ class Saver:
             if dataFilename.is_file():
                 dataFilename.unlink()
         elif isinstance(archiveRecoveryStrategy, RBackup):
-            if self.backupArchive(channel, channelOutfile, channelOutfile+'--backup', backupAltNames()) == RSkipDownload():
+            if self.backupArchive(channel, channelOutfile, backupOutfile, backupAltNames()) == RSkipDownload():
                 return
 
         header.storage = PostStorage.fromOptions(options)
@@ -905,13 +1080,13 @@ class Saver:
                     dataFilename.unlink()
                 archiveFileInfo = None
             elif isinstance(opts, RBackup):
-                if self.backupArchive(channel, channelOutfile, channelOutfile+'--backup', backupAltNames()) == RSkipDownload():
+                if self.backupArchive(channel, channelOutfile, backupOutfile, backupAltNames()) == RSkipDownload():
                     return
                 archiveFileInfo = None
             else:
                 assert isinstance(opts, RReuse)
                 # Old header is backed up for rollback
-                if self.backupArchive(channel, channelOutfile, channelOutfile+'--backup', backupAltNames(), headerOnly=not fromScratch) == RSkipDownload():
+                if self.backupArchive(channel, channelOutfile, backupOutfile, backupAltNames(), headerOnly=not fromScratch) == RSkipDownload():
                     return
 
         # By now, header file shouldn't exist and posts file should exist only if we're planning to append
@@ -920,7 +1095,8 @@ class Saver:
         try:
             attachments: List[FileAttachment] = []
 
-            with open(dataFilename, 'w' if fromScratch else 'a', encoding='utf8') as output:
+            # Posts are small, so they get written in larger chunks
+            with open(dataFilename, 'wb' if fromScratch else 'ab', buffering=1 << 20) as output:
                 if showProgressReport:
                     estimatedPostLimit: int = channel.messageCount
                     if options.postLimit != -1:
@@ -938,37 +1114,53 @@ class Saver:
                     # Reporter should be never accessed in this case, but we want clear type for linting
                     progressReporter = cast(progress.ProgressReporter, UnboundLocalError)
 
+                # Options don't change during download, so they are resolved before processing posts
                 takeEmojis: bool = options.emojiMetadata or options.downloadEmoji
-
-                def perPost(p: Post, hints: MattermostDriver.PostHints):
-                    assert header.storage is not None
-
-                    header.usedUsers.add(self.driver.getUserById(p.userId))
-                    if options.downloadAttachments:
-                        for attachment in p.attachments:
-                            attachments.append(attachment)
-                    self.enrichPost(p)
+                takeAttachments: bool = options.downloadAttachments
+                timeDirection = options.downloadTimeDirection
+                storage = header.storage
+                assert storage is not None
+                usedEmojis = header.usedEmojis
+                enrichPost = self.enrichPost
+                # Authors are resolved into users only once the download is done
+                usedUserIds: Set[Id] = set()
+
+                cancelled = self.cancelled
+
+                def storePost(p: Post, hints: MattermostDriver.PostHints):
+                    if cancelled.is_set():
+                        raise DownloadCancelled
+                    usedUserIds.add(p.userId)
+                    if takeAttachments:
+                        attachments.extend(p.attachments)
+                    enrichPost(p)
                     if p.emojis:
                         if takeEmojis:
-                            for emoji in p.emojis:
-                                assert isinstance(emoji, Emoji)
-                                header.usedEmojis.add(emoji)
-                            p.emojis = [cast(Emoji, emoji).id for emoji in p.emojis]
+                            # Freshly downloaded posts contain full emojis, stored ones only ids
+                            emojiIds: List[Id] = []
+                            for emoji in cast(List[Emoji], p.emojis):
+                                usedEmojis[emoji.id] = emoji
+                                emojiIds.append(emoji.id)
+                            p.emojis = emojiIds
                         else:
                             p.emojis = []
-                    self.jsonDumpToFile(p.toStore(), output)
-                    output.write('\n')
+                    self.writePost(p, output)
 
-                    header.storage.addSortedPost(p, hints, options.downloadTimeDirection)
-                    if showProgressReport:
-                        progressReporter.update(str(header.storage.count))
+                    storage.addSortedPost(p, hints, timeDirection)
+
+                if showProgressReport:
+                    def perPost(p: Post, hints: MattermostDriver.PostHints):
+                        storePost(p, hints)
+                        progressReporter.update(str(storage.count))
+                else:
+                    perPost = storePost
 
                 if showProgressReport:
                     skippedPostCount = 0
                     skippedLeadingMsg = False
                     def onSkippedPost():
                         nonlocal skippedLeadingMsg, skippedPostCount
-                        if showProgressReport and skippedPostCount % 99 == 0:
+                        if skippedPostCount % 99 == 0:
                             if skippedLeadingMsg:
                                 print('.', end='', file=sys.stderr, flush=True)
                             else:
@@ -978,7 +1170,8 @@ class Saver:
                 else:
                     def onSkippedPost():
                         pass
-                postProcessRes = self.driver.processPosts(processor=perPost, channel=channel, **dlParams, onSkippedPost=onSkippedPost)
+                postProcessRes = self.driver.processPosts(processor=perPost, channel=channel, **dlParams,
+                    onSkippedPost=onSkippedPost, prefetchUsers=True, prefetcher=self.postPrefetcher)
 
                 if showProgressReport:
                     progressReporter.close()
@@ -992,8 +1185,15 @@ class Saver:
                     assert postProcessRes == MattermostDriver.ProcessPostResult.ConditionReached
                     logging.info('Processed up to selected condition.')
 
-                # Update header's bytesize
+                # Every author gets resolved, unknown ones fail the same way as per-post lookups used to
+                authors = self.driver.getUsersByIds(usedUserIds)
+                assert len(authors) == len(usedUserIds)
+                header.usedUsers.update(authors)
+
+                # Update header's bytesize, posts are made durable before the header refers to them.
+                # That's a single fsync per channel download, never one per post.
                 output.flush()
+                os.fsync(output.fileno())
                 header.storage.byteSize = os.fstat(output.fileno()).st_size
 
             self.processChannelAuxiliaries(channelOutfile, header, options, attachments)
@@ -1005,14 +1205,13 @@ class Saver:
 
             # Store new header file
             headerContent = header.toStore()
-            with open(headerFilename, 'w', encoding='utf8') as headerFile:
-                self.jsonDumpToFile(headerContent, headerFile)
+            writeFileAtomically(headerFilename, dumpJson(headerContent))
         except BaseException as err:
             # In appending mode, revert to pre-download state is done unconditionally
             if (isinstance(archiveRecoveryStrategy, RReuse) and not fromScratch):
                 assert archiveFileInfo is not None
                 oldDataFileSize = archiveFileInfo.dataFileStats.st_size if archiveFileInfo.dataFileStats is not None else None
-                self.restoreArchiveBackup(channelOutfile, channelOutfile+'--backup', oldDataFileSize=oldDataFileSize)
+                self.restoreArchiveBackup(channelOutfile, backupOutfile, oldDataFileSize=oldDataFileSize)
             else:
                 opts = self.recoveryArbiter.onPostLoadingFailure(header, headerFilename, dataFilename, err)
                 if isinstance(opts, RDelete):
@@ -1024,7 +1223,7 @@ class Saver:
                         assert fromScratch
                         # If we're willing to reuse, but started from the scratch,
                         # we can restore the backup back into primary
-                        self.restoreArchiveBackup(channelOutfile, channelOutfile+'--backup')
+                        self.restoreArchiveBackup(channelOutfile, backupOutfile)
                 else:
                     assert isinstance(opts, RBackup)
                     # Just keep broken downloaded state
@@ -1032,7 +1231,7 @@ class Saver:
 
         # Now we can remove temporary backup
         if isinstance(archiveRecoveryStrategy, RReuse):
-            backup1, backup2 = self.makeArchiveFilenames(channelOutfile+'--backup')
+            backup1, backup2 = self.makeArchiveFilenames(backupOutfile)
             if backup1.is_file():
                 backup1.unlink()
             if backup2.is_file():
@@ -1044,7 +1243,7 @@ class Saver:
 
         directChannelOutfile = f'd.{self.user.name}--{otherUser.name}'
         header = ChannelHeader(channel=channelRequest.metadata)
-        header.usedUsers = {self.user, otherUser}
+        header.usedUsers = {self.user.id: self.user, otherUser.id: otherUser}
 
         self.processChannel(channelOutfile=directChannelOutfile, header=header, channelRequest=channelRequest)
 
@@ -1079,12 +1278,35 @@ class Saver:
 
         self.processChannel(channelOutfile=channelOutfile, header=header, channelRequest=channelRequest)
 
+    def runConcurrently(self, tasks: List[Callable[[], None]]):
+        '''
+            Runs channel processing tasks in thread pool, reporting overall progress as channels finish.
+            Downloading is bound by server latency and every channel is stored into its own files,
+            so channels don't need to wait for each other.
+
+            If any channel fails or the download gets interrupted, channels in progress are signalled
+            to stop at their next post (or file) and roll back like on interruption. Their requests
+            already sent to the server are still waited for.
+        '''
+        self.cancelled.clear()
+        with self.driver.workerPool(self.configfile.parallelism or 8) as executor:
+            futures = [executor.submit(task) for task in tasks]
+            try:
+                for i, future in enumerate(as_completed(futures), start=1):
+                    future.result()
+                    logging.info(f'Finished {i} of {len(futures)} channels.')
+            except BaseException:
+                self.cancelled.set()
+                # Don't wait for channels that haven't started yet
+                for future in futures:
+                    future.cancel()
+                raise
+
     def __call__(self):
         '''
             Entrypoint of the Saver logic. Throws SavingFailed on known errors.
         '''
-        if not self.configfile.outputDirectory.is_dir():
-            self.configfile.outputDirectory.mkdir()
+        self.configfile.outputDirectory.mkdir(parents=True, exist_ok=True)
         m = self.driver
 
         logging.info(f'Logging in as {self.configfile.username}.')
@@ -1102,8 +1324,13 @@ class Saver:
                 raise SavingFailed(f'User {self.configfile.username} is not member of any teams!')
 
             logging.info('Collecting metadata about available channels ...')
-            for team in teams.values():
-                m.loadChannels(teamId=team.id)
+            if self.configfile.parallelism == 1:
+                for team in teams.values():
+                    m.loadChannels(teamId=team.id)
+            else:
+                # Teams are independent, each one fills only its own channels
+                with self.driver.workerPool(self.configfile.parallelism or 8) as executor:
+                    list(executor.map(lambda team: m.loadChannels(teamId=team.id), teams.values()))
 
             if self.configfile.downloadAllEmojis:
                 logging.info('Downloading emoji database ...')
@@ -1113,17 +1340,27 @@ class Saver:
                 self.processEmoji('emojis', emojis)
 
             logging.info('Selecting channels to download ...')
-            directChannels, groupChannels = self.getWantedGlobalChannels()
-            teamChannels = self.getWantedPerTeamChannels()
+            directChannels, groupChannels = self.getWantedGlobalChannels(teams)
+            teamChannels = self.getWantedPerTeamChannels(teams)
 
             logging.info('Processing channels ...')
+            tasks: List[Callable[[], None]] = []
             for user, channel in directChannels.items():
-                self.processDirectChannel(user, channel)
+                tasks.append(partial(self.processDirectChannel, user, channel))
             for channel in groupChannels:
-                self.processGroupChannel(channel)
+                tasks.append(partial(self.processGroupChannel, channel))
             for team, perTeamChannels in teamChannels.items():
                 for channel in perTeamChannels:
-                    self.processTeamChannel(team, channel)
+                    tasks.append(partial(self.processTeamChannel, team, channel))
+
+            # Single pool for the whole run keeps prefetching from opening new connections for every channel,
+            # each channel needs at most one worker at a time
+            with m.workerPool(self.configfile.parallelism or 8, wait=False) as self.postPrefetcher:
+                if self.configfile.parallelism == 1:
+                    for task in tasks:
+                        task()
+                else:
+                    self.runConcurrently(tasks)
         except KeyboardInterrupt:
             logging.info('Downloading interrupted.')
             return
@@ -24,6 +24,60 @@ from os import stat_result
 # HACK: Pyright linter doesn't recognize special meaning of ClassVar from .common in dataclasses
 from typing import ClassVar
 
+try:
+    import orjson
+except ImportError:
+    # Optional acceleration, stdlib json is used otherwise
+    orjson = None
+
+
+def storeFallback(obj: Any) -> Any:
+    '''Converts objects not representable in JSON directly, such as nested business objects.'''
+    if hasattr(obj, 'toStore'):
+        return obj.toStore()
+    return str(obj)
+
+def dumpJson(obj: Any) -> bytes:
+    '''
+        Serializes object into compact UTF-8 encoded JSON, as used in storage files.
+
+        Output of orjson and stdlib json is equivalent, not byte-identical: float formatting
+        differs (`1e16` vs `1e+16`) and orjson writes non-finite floats as `null`
+        where stdlib writes `NaN`/`Infinity`. Both load back to the same values, as data from
+        the server is strict JSON and never contains non-finite floats.
+    '''
+    if orjson is not None:
+        try:
+            # Dataclasses would get serialized natively, skipping their `toStore`
+            return orjson.dumps(obj, default=storeFallback, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+        except TypeError:
+            # orjson is stricter than stdlib (for example on integer range), which handles the rest
+            pass
+    return json.dumps(obj, default=storeFallback, ensure_ascii=False, separators=(',', ':')).encode('utf8')
+
+def writeFileAtomically(filename: Path, content: bytes):
+    '''
+        Replaces file content as a whole, so that interrupted write never leaves it partially written.
+    '''
+    tempFilename = filename.with_name(filename.name + '.tmp')
+    with open(tempFilename, 'wb') as tempFile:
+        tempFile.write(content)
+        tempFile.flush()
+        os.fsync(tempFile.fileno())
+    os.replace(tempFilename, filename)
+
+def loadJson(data: bytes) -> Any:
+    '''
+        Parses UTF-8 encoded JSON, counterpart of `dumpJson`.
+    '''
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # Let stdlib decide and report the error in its usual form
+            pass
+    return json.loads(data)
+
 
 class PostOrdering(Enum):
     '''
@@ -136,9 +190,9 @@ class ChannelHeader:
     # (as long as header is not currently getting filled)
     storage: Optional[PostStorage] = None
     # Users that appeared in conversations
-    usedUsers: Set[User] = dataclassfield(default_factory=set)
+    usedUsers: Dict[Id, User] = dataclassfield(default_factory=dict)
     # Emojis that appeared in conversations
-    usedEmojis: Set[Emoji] = dataclassfield(default_factory=set)
+    usedEmojis: Dict[Id, Emoji] = dataclassfield(default_factory=dict)
 
     @classmethod
     def fromStore(cls, info: Any):
@@ -164,9 +218,10 @@ class ChannelHeader:
         self = cast(ChannelHeader, ClassMock())
         self.channel = Channel.fromStore(info['channel'])
         if 'users' in info:
-            self.usedUsers = set()
+            self.usedUsers = {}
             for userInfo in info['users']:
-                self.usedUsers.add(User.fromStore(userInfo))
+                user = User.fromStore(userInfo)
+                self.usedUsers[user.id] = user
         if 'team' in info:
             self.team = Team.fromStore(info['team'])
         if 'storage' in info:
@@ -174,9 +229,10 @@ class ChannelHeader:
             if storage.count != 0:
                 self.storage = storage
         if 'emojis' in info:
-            self.usedEmojis = set()
+            self.usedEmojis = {}
             for emojiInfo in info['emojis']:
-                self.usedEmojis.add(Emoji.fromStore(emojiInfo))
+                emoji = Emoji.fromStore(emojiInfo)
+                self.usedEmojis[emoji.id] = emoji
         return cls(**self.__dict__)
 
     def update(self, other: 'ChannelHeader'):
@@ -188,22 +244,22 @@ class ChannelHeader:
                 self.storage.update(other.storage)
             else:
                 self.storage = copy(other.storage)
-        self.usedUsers = other.usedUsers | self.usedUsers
-        self.usedEmojis = other.usedEmojis | self.usedEmojis
+        self.usedUsers.update(other.usedUsers)
+        self.usedEmojis.update(other.usedEmojis)
 
     def toStore(self) -> dict:
         content: Dict[str, Any] = {
             'version': '1'
         }
         if self.team:
-            content.update(team=self.team.toStore(includeChannels=False))
-        content.update(channel=self.channel.toStore())
+            content['team'] = self.team.toStore(includeChannels=False)
+        content['channel'] = self.channel.toStore()
         if self.storage is not None and self.storage.count > 0:
-            content.update(storage=self.storage.toStore())
+            content['storage'] = self.storage.toStore()
         if self.usedUsers:
-            content.update(users=[u.toStore() for u in self.usedUsers])
+            content['users'] = [u.toStore() for u in self.usedUsers.values()]
         if self.usedEmojis:
-            content.update(emojis=[e.toStore() for e in self.usedEmojis])
+            content['emojis'] = [e.toStore() for e in self.usedEmojis.values()]
 
         return content
 
@@ -237,9 +293,9 @@ class ChannelFileInfo:
         headerStat = headerFilename.stat()
         dataStat = dataFilename.stat() if dataFilename.is_file() else None
 
-        with open(headerFilename, 'r', encoding='utf8') as headerFile:
+        with open(headerFilename, 'rb') as headerFile:
             try:
-                return ChannelFileInfo(ChannelHeader.fromStore(json.load(headerFile)), headerStat, dataStat)
+                return ChannelFileInfo(ChannelHeader.fromStore(loadJson(headerFile.read())), headerStat, dataStat)
             except Exception:
                 logging.warning(exceptionFormatter(f"Unable to load existing metadata for channel '{channel.internalName}'."))
                 return None